@@ -1,9 +1,13 @@
 import os
+import asyncio
+import hashlib
+import json
 import logging
+from pathlib import Path
 from dotenv import load_dotenv
 from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import DocumentIntelligenceClient
-from azure.ai.documentintelligence.models import AnalyzeDocumentRequest, DocumentContentFormat
+from azure.ai.documentintelligence.aio import DocumentIntelligenceClient
+from azure.ai.documentintelligence.models import DocumentContentFormat
 
 # Configure logging
 logging.basicConfig(
@@ -17,85 +21,192 @@ load_dotenv()
 endpoint = os.getenv("di_enpoint")
 key = os.getenv("di_key")
 
+# Maximum number of documents analyzed concurrently
+MAX_CONCURRENT_DOCS = 5
 
-def analyze_document(endpoint, key, doc_bytes):
-    logger.info("Starting document analysis")
-    document_intelligence_client = DocumentIntelligenceClient(
+# Seconds between status polls when the service sends no Retry-After header (SDK default is 30)
+POLLING_INTERVAL = 1
+
+# Directory the markdown files are written to
+OUTPUT_DIR = "outputs"
+
+# Content hashes of converted documents, used to skip unchanged documents on later runs
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, ".manifest.json")
+
+# Documents at least this large are streamed from disk instead of read into memory
+STREAM_THRESHOLD = 64 * 1024
+
+
+def create_client():
+    """Create the shared Document Intelligence client used for all documents."""
+    return DocumentIntelligenceClient(
         endpoint=endpoint, credential=AzureKeyCredential(key)
     )
 
+
+async def analyze_document(client, document):
+    logger.info("Starting document analysis")
     logger.info("Sending document to Azure Document Intelligence")
-    poller = document_intelligence_client.begin_analyze_document(
-        "prebuilt-layout", AnalyzeDocumentRequest(bytes_source=doc_bytes), output_content_format=DocumentContentFormat.MARKDOWN
+    # Bytes and open files are uploaded as-is (application/octet-stream), without base64 encoding
+    poller = await client.begin_analyze_document(
+        "prebuilt-layout", document, output_content_format=DocumentContentFormat.MARKDOWN,
+        polling_interval=POLLING_INTERVAL
     )
-    result = poller.result()
+    result = await poller.result()
     logger.info("Document analysis completed successfully")
     # Access the markdown content through the content property
     return result.content
 
-def read_docs():
+def load_document(file_path):
+    """Read a small document into memory, or open a large one for streaming."""
+    f = open(file_path, 'rb')
+    if os.fstat(f.fileno()).st_size >= STREAM_THRESHOLD:
+        return f
+    with f:
+        return f.read()
+
+def hash_document(document):
+    """Return a content hash of a document loaded by load_document."""
+    if isinstance(document, bytes):
+        return hashlib.blake2b(document, digest_size=16).hexdigest()
+    digest = hashlib.file_digest(document, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+    document.seek(0)
+    return digest
+
+def load_manifest():
+    """Load the content hashes of previously converted documents."""
+    try:
+        return json.loads(Path(MANIFEST_PATH).read_bytes())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_manifest(manifest):
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+def get_output_path(filename):
+    # Create output filename by replacing extension with .md
+    output_filename = os.path.splitext(filename)[0] + '.md'
+    return os.path.join(OUTPUT_DIR, output_filename)
+
+def iter_docs():
+    """Yield (filename, path) for each document in the docs directory."""
     logger.info("Starting to read documents from docs directory")
-    docs_bytes = {}
     docs_dir = "docs"
     
-    # Check if directory exists
-    if not os.path.exists(docs_dir):
+    try:
+        entries = os.scandir(docs_dir)
+    except FileNotFoundError:
         logger.warning(f"Directory {docs_dir} does not exist")
-        return docs_bytes
-        
-    # Iterate through all files in docs directory
-    for filename in os.listdir(docs_dir):
-        file_path = os.path.join(docs_dir, filename)
+        return
         
-        # Read file as bytes if it's a file (not a directory)
-        if os.path.isfile(file_path):
-            logger.info(f"Reading file: {filename}")
-            with open(file_path, 'rb') as f:
-                docs_bytes[filename] = f.read()
-    
-    logger.info(f"Found {len(docs_bytes)} documents to process")
-    return docs_bytes
+    # Iterate through all files in docs directory; scandir caches the entry type
+    with entries:
+        for entry in entries:
+            # Only yield files, not directories
+            if entry.is_file():
+                yield entry.name, entry.path
 
 def save_to_outputs(filename, content):
     logger.info("Saving content to outputs directory")
-    output_dir = "outputs"
-    
-    # Create outputs directory if it doesn't exist
-    if not os.path.exists(output_dir):
-        logger.info("Creating outputs directory")
-        os.makedirs(output_dir)
-    
-    # Create output filename by replacing extension with .md
-    output_filename = os.path.splitext(filename)[0] + '.md'
-    output_path = os.path.join(output_dir, output_filename)
+    output_path = get_output_path(filename)
     
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        Path(output_path).write_text(content, encoding='utf-8')
         logger.info(f"Successfully saved content to {output_path}")
+        return True
     except Exception as e:
         logger.error(f"Error saving file {output_path}: {str(e)}", exc_info=True)
+        return False
 
 
-if __name__ == "__main__":
-    logger.info("Starting document processing")
-    # Read all documents from docs directory
-    documents = read_docs()
-    
-    # Process each document
-    for filename, doc_bytes in documents.items():
+def close_document(document):
+    # Large documents are open files that must be closed after upload
+    if hasattr(document, 'close'):
+        document.close()
+
+
+def read_document(file_path):
+    """Load a document and return it together with its content hash."""
+    document = load_document(file_path)
+    try:
+        return document, hash_document(document)
+    except Exception:
+        close_document(document)
+        raise
+
+
+async def read_documents(queue, manifest, num_workers):
+    """Load documents from disk and queue the ones that need converting.
+
+    Documents whose content hash matches the manifest and whose output still exists are skipped.
+    """
+    try:
+        for filename, file_path in iter_docs():
+            try:
+                document, digest = await asyncio.to_thread(read_document, file_path)
+            except Exception as e:
+                logger.error(f"Error reading {filename}: {str(e)}", exc_info=True)
+                continue
+
+            if manifest.get(filename) == digest and os.path.exists(get_output_path(filename)):
+                logger.info(f"Skipping {filename}: already converted")
+                close_document(document)
+                continue
+
+            # Blocks while the queue is full so only a few documents are held in memory
+            await queue.put((filename, document, digest))
+    finally:
+        # One sentinel per worker so every worker stops
+        for _ in range(num_workers):
+            await queue.put(None)
+
+
+async def convert_documents(client, queue, manifest):
+    """Analyze queued documents and save the markdown results until a sentinel is received."""
+    while (item := await queue.get()) is not None:
+        filename, document, digest = item
         try:
             logger.info(f"Processing document: {filename}")
-            result = analyze_document(endpoint, key, doc_bytes)
+            try:
+                result = await analyze_document(client, document)
+            finally:
+                close_document(document)
             logger.info(f"Successfully analyzed {filename}")
-            
-            save_to_outputs(filename, result)
 
+            if await asyncio.to_thread(save_to_outputs, filename, result):
+                manifest[filename] = digest
         except Exception as e:
             logger.error(f"Error processing {filename}: {str(e)}", exc_info=True)
-    
-    logger.info("Document processing completed")
 
 
+async def main_async():
+    logger.info("Starting document processing")
+    if not endpoint or not key:
+        logger.error("di_enpoint and di_key must be set to use Azure Document Intelligence")
+        return
+
+    # Create the outputs directory once, before any concurrent writes
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    manifest = load_manifest()
 
+    # Disk reads overlap with the Document Intelligence calls; the bounded queue applies backpressure
+    queue = asyncio.Queue(maxsize=MAX_CONCURRENT_DOCS * 2)
 
+    # One client for all documents so the HTTP session is reused
+    # Save the manifest even when a task fails, so finished documents aren't converted again
+    try:
+        async with create_client() as client:
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(read_documents(queue, manifest, MAX_CONCURRENT_DOCS))
+                for _ in range(MAX_CONCURRENT_DOCS):
+                    tg.create_task(convert_documents(client, queue, manifest))
+    finally:
+        save_manifest(manifest)
+
+    logger.info("Document processing completed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -1,172 +1,146 @@
 import os
+import sys
 from rich.console import Console
-from rich.prompt import Prompt, Confirm
+from rich.prompt import Confirm, IntPrompt
 from rich.panel import Panel
-from rich import print as rprint
-from openai import AsyncAzureOpenAI
-import json
+import orjson
 from dotenv import load_dotenv
 import logging
-from datetime import datetime
-from rich.table import Table
-from statistics import mode, mean
+from collections import Counter
 import asyncio
-from asyncio import Semaphore
-from extractors import ExtractorFactory
+from contextlib import nullcontext
+from rate_limit import AdmissionController, CreditSemaphore, estimate_tokens
+from tenacity import AsyncRetrying, before_sleep_log, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 import argparse
+from pathlib import Path
+from functools import lru_cache
+from dataclasses import dataclass, replace
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from rich.logging import RichHandler
 
-# Configure logging
+# Initialize Rich console
+console = Console()
+
+# Configure logging; the file and console writes happen on a background thread
+# so concurrent runs don't wait on each other's log output. Console logs go through
+# the Rich console so they print above the live results table instead of into it.
+_file_handler = logging.FileHandler('api_calls.log')
+_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(
+    _log_queue,
+    _file_handler,
+    RichHandler(console=console)
+)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('api_calls.log'),
-        logging.StreamHandler()
-    ]
+    format='%(message)s',
+    handlers=[QueueHandler(_log_queue)]
 )
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
+def flush_logs():
+    """Write out the queued log records; stopping the listener drains its queue."""
+    _log_listener.stop()
+    _log_listener.start()
+
 load_dotenv()
 
-openai_key = os.getenv("openai_key")
-openai_endpoint = os.getenv("openai_endpoint")
-openai_api_version = os.getenv("openai_api_version")
+# Reads the document and schema in the background while the user is still answering prompts
+_prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch')
 
-# Initialize Rich console
-console = Console()
+# Most completions requested in a single call when runs are batched
+MAX_COMPLETIONS_PER_REQUEST = 10
 
-def select_file(config):
-    """Select a file from the outputs directory using Rich."""
-    outputs_dir = "outputs"
-    files = [f for f in os.listdir(outputs_dir) if f.endswith('.md')]
-    
-    if not files:
-        console.print("[red]No markdown files found in outputs directory![/red]")
-        return None
-    
-    # If there's only one file, automatically select it
-    if len(files) == 1:
-        console.print(f"\n[green]Only one file found:[/green] {files[0]}")
-        return os.path.join(outputs_dir, files[0])
-    
-    # Check for default file in config
-    default_file = config.get('default_doc')
-    if default_file and default_file in files:
-        console.print(f"\n[green]Using default file:[/green] {default_file}")
-        return os.path.join(outputs_dir, default_file)
-    
-    console.print("\n[bold blue]Available files:[/bold blue]")
-    for idx, file in enumerate(files, 1):
-        is_default = file == default_file
-        default_marker = " (default)" if is_default else ""
-        console.print(f"{idx}. {file}{default_marker}")
+# Exponential backoff with jitter for throttled or failing API calls
+_backoff = wait_random_exponential(multiplier=1, max=60)
+
+def wait_retry_after(retry_state):
+    """Wait for the Retry-After header if the API sent one, otherwise back off exponentially."""
+    response = getattr(retry_state.outcome.exception(), 'response', None)
+    if response is not None:
+        retry_after = response.headers.get('retry-after')
+        if retry_after:
+            try:
+                return min(float(retry_after), 60)
+            except ValueError:
+                pass
+    return _backoff(retry_state)
+
+def select_index(label, count, default_idx=1):
+    """Ask for a number between 1 and count and return the zero-based index."""
+    choice = IntPrompt.ask(
+        f"\n[bold green]Select {label} number[/bold green]",
+        choices=[str(i) for i in range(1, count + 1)],
+        default=default_idx,
+        show_choices=False,
+    )
+    return choice - 1
+
+def list_files(directory, extension):
+    """List the names of regular files in a directory with the given extension."""
+    with os.scandir(directory) as entries:
+        return [e.name for e in entries if e.name.endswith(extension) and e.is_file()]
+
+def _select_from_dir(directory, extension, default, label, kind, use_default=True):
+    """Use the default file if it exists, otherwise pick one from a directory using Rich.
+
+    With use_default=False the list is always shown, with the default preselected.
+    """
+    # Use the default from config if it exists, without listing the directory
+    if use_default and default and os.path.isfile(os.path.join(directory, default)):
+        console.print(f"\n[green]Using default {label}:[/green] {default}")
+        return os.path.join(directory, default)
     
-    while True:
-        try:
-            default_idx = files.index(default_file) + 1 if default_file in files else 1
-            choice = Prompt.ask("\n[bold green]Select a file number[/bold green]", default=str(default_idx))
-            idx = int(choice) - 1
-            if 0 <= idx < len(files):
-                return os.path.join(outputs_dir, files[idx])
-            else:
-                console.print("[red]Invalid selection. Please try again.[/red]")
-        except ValueError:
-            console.print("[red]Please enter a valid number.[/red]")
-
-def select_schema(config):
-    """Select a schema file from the schemas directory using Rich."""
-    schemas_dir = "schemas"
-    files = [f for f in os.listdir(schemas_dir) if f.endswith('.json')]
+    files = sorted(list_files(directory, extension))
     
     if not files:
-        console.print("[red]No schema files found in schemas directory![/red]")
+        console.print(f"[red]No {kind} files found in {directory} directory![/red]")
         return None
     
     # If there's only one file, automatically select it
     if len(files) == 1:
-        console.print(f"\n[green]Only one schema found:[/green] {files[0]}")
-        return os.path.join(schemas_dir, files[0])
+        console.print(f"\n[green]Only one {label} found:[/green] {files[0]}")
+        return os.path.join(directory, files[0])
     
-    # Check for default schema in config
-    default_schema = config.get('default_schema')
-    if default_schema and default_schema in files:
-        console.print(f"\n[green]Using default schema:[/green] {default_schema}")
-        return os.path.join(schemas_dir, default_schema)
-    
-    console.print("\n[bold blue]Available schemas:[/bold blue]")
+    console.print(f"\n[bold blue]Available {label}s:[/bold blue]")
     for idx, file in enumerate(files, 1):
-        is_default = file == default_schema
-        default_marker = " (default)" if is_default else ""
-        console.print(f"{idx}. {file}{default_marker}")
+        console.print(f"{idx}. {file}")
     
-    while True:
-        try:
-            default_idx = files.index(default_schema) + 1 if default_schema in files else 1
-            choice = Prompt.ask("\n[bold green]Select a schema number[/bold green]", default=str(default_idx))
-            idx = int(choice) - 1
-            if 0 <= idx < len(files):
-                return os.path.join(schemas_dir, files[idx])
-            else:
-                console.print("[red]Invalid selection. Please try again.[/red]")
-        except ValueError:
-            console.print("[red]Please enter a valid number.[/red]")
-
-def select_output_schema(config):
+    article = "an" if label[0] in "aeiou" else "a"
+    default_idx = files.index(default) + 1 if default in files else 1
+    idx = select_index(f"{article} {label}", len(files), default_idx)
+    return os.path.join(directory, files[idx])
+
+def select_file(config, use_default=True):
+    """Select a file from the outputs directory using Rich."""
+    return _select_from_dir("outputs", '.md', config.get('default_doc'), "file", "markdown", use_default)
+
+def select_schema(config, use_default=True):
+    """Select a schema file from the schemas directory using Rich."""
+    return _select_from_dir("schemas", '.json', config.get('default_schema'), "schema", "schema", use_default)
+
+def select_output_schema(config, use_default=True):
     """Select an output schema file from the output_schemas directory using Rich."""
-    schemas_dir = "output_schemas"
-    files = [f for f in os.listdir(schemas_dir) if f.endswith('.json')]
-    
-    if not files:
-        console.print("[red]No output schema files found in output_schemas directory![/red]")
-        return None
-    
-    # If there's only one file, automatically select it
-    if len(files) == 1:
-        console.print(f"\n[green]Only one output schema found:[/green] {files[0]}")
-        return os.path.join(schemas_dir, files[0])
-    
-    # Check for default output schema in config
-    default_schema = config.get('default_output_schema')
-    if default_schema and default_schema in files:
-        console.print(f"\n[green]Using default output schema:[/green] {default_schema}")
-        return os.path.join(schemas_dir, default_schema)
-    
-    console.print("\n[bold blue]Available output schemas:[/bold blue]")
-    for idx, file in enumerate(files, 1):
-        is_default = file == default_schema
-        default_marker = " (default)" if is_default else ""
-        console.print(f"{idx}. {file}{default_marker}")
-    
-    while True:
-        try:
-            default_idx = files.index(default_schema) + 1 if default_schema in files else 1
-            choice = Prompt.ask("\n[bold green]Select an output schema number[/bold green]", default=str(default_idx))
-            idx = int(choice) - 1
-            if 0 <= idx < len(files):
-                return os.path.join(schemas_dir, files[idx])
-            else:
-                console.print("[red]Invalid selection. Please try again.[/red]")
-        except ValueError:
-            console.print("[red]Please enter a valid number.[/red]")
+    return _select_from_dir("output_schemas", '.json', config.get('default_output_schema'), "output schema", "output schema", use_default)
 
 def get_number_of_runs():
     """Get the number of runs from the user."""
     while True:
-        try:
-            runs = Prompt.ask("\n[bold green]How many runs would you like to perform?[/bold green]", default="1")
-            runs = int(runs)
-            if runs > 0:
-                return runs
-            else:
-                console.print("[red]Please enter a positive number.[/red]")
-        except ValueError:
-            console.print("[red]Please enter a valid number.[/red]")
+        runs = IntPrompt.ask("\n[bold green]How many runs would you like to perform?[/bold green]", default=1)
+        if runs > 0:
+            return runs
+        console.print("[red]Please enter a positive number.[/red]")
 
 def load_config():
     """Load and validate the configuration file."""
     try:
-        with open('config.json', 'r', encoding='utf-8') as f:
-            config = json.load(f)
+        config = orjson.loads(Path('config.json').read_bytes())
         
         if 'models' not in config:
             console.print("[red]Error: config.json must contain a 'models' section[/red]")
@@ -176,12 +150,12 @@ def load_config():
     except FileNotFoundError:
         console.print("[red]Error: config.json not found[/red]")
         return None
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         console.print("[red]Error: config.json is not valid JSON[/red]")
         return None
 
-def select_model(config):
-    """Select a model from the configuration."""
+def select_model(config, use_default=True):
+    """Select a model from the configuration; with use_default=False always show the list."""
     models = list(config['models'].keys())
     
     if not models:
@@ -195,7 +169,7 @@ def select_model(config):
     
     # Check for default model in config
     default_model = config.get('default_model')
-    if default_model and default_model in models:
+    if use_default and default_model and default_model in models:
         console.print(f"\n[green]Using default model:[/green] {default_model}")
         return default_model
     
@@ -206,20 +180,12 @@ def select_model(config):
         default_marker = " (default)" if is_default else ""
         console.print(f"{idx}. {model}{default_marker} - {description}")
     
-    while True:
-        try:
-            default_idx = models.index(default_model) + 1 if default_model in models else 1
-            choice = Prompt.ask("\n[bold green]Select a model number[/bold green]", default=str(default_idx))
-            idx = int(choice) - 1
-            if 0 <= idx < len(models):
-                return models[idx]
-            else:
-                console.print("[red]Invalid selection. Please try again.[/red]")
-        except ValueError:
-            console.print("[red]Please enter a valid number.[/red]")
-
-def select_extractor(config):
-    """Select an extractor from the configuration."""
+    default_idx = models.index(default_model) + 1 if default_model in models else 1
+    idx = select_index("a model", len(models), default_idx)
+    return models[idx]
+
+def select_extractor(config, use_default=True):
+    """Select an extractor from the configuration; with use_default=False always show the list."""
     # Get extractors list from config, ensuring it's a list
     extractors = config.get('extractors', [])
     if isinstance(extractors, dict):
@@ -236,7 +202,7 @@ def select_extractor(config):
     
     # Check for default extractor in config
     default_extractor = config.get('default_extractor')
-    if default_extractor and default_extractor in extractors:
+    if use_default and default_extractor and default_extractor in extractors:
         console.print(f"\n[green]Using default extractor:[/green] {default_extractor}")
         return default_extractor
     
@@ -250,17 +216,9 @@ def select_extractor(config):
     if "structured_output" in extractors:
         console.print("\n[red]Structured output mode is experimental and likely to fail[/red]")
     
-    while True:
-        try:
-            default_idx = extractors.index(default_extractor) + 1 if default_extractor in extractors else 1
-            choice = Prompt.ask("\n[bold green]Select an extractor number[/bold green]", default=str(default_idx))
-            idx = int(choice) - 1
-            if 0 <= idx < len(extractors):
-                return extractors[idx]
-            else:
-                console.print("[red]Invalid selection. Please try again.[/red]")
-        except ValueError:
-            console.print("[red]Please enter a valid number.[/red]")
+    default_idx = extractors.index(default_extractor) + 1 if default_extractor in extractors else 1
+    idx = select_index("an extractor", len(extractors), default_idx)
+    return extractors[idx]
 
 def display_config(config, selected_model, selected_extractor):
     """Display the current configuration."""
@@ -275,131 +233,284 @@ def display_config(config, selected_model, selected_extractor):
     
     console.print(Panel.fit(config_text, title="Current Configuration", border_style="blue"))
     
+    # Nobody can answer the prompt when input is piped
+    if not sys.stdin.isatty():
+        return True
+    
     return Confirm.ask("\n[bold green]Proceed with this configuration?[/bold green]", default=True)
 
-async def extract_currency_async(file_path, schema_path, semaphore, run_number, model_config, extraction_method="json_mode"):
-    """Extract currency information using OpenAI API with semaphore for rate limiting."""
-    async with semaphore:
-        # Read the file content
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Read selected schema
-        with open(schema_path, 'r', encoding='utf-8') as f:
-            schema = json.load(f)
+async def extract_currency_async(extractor, content, schema, admission, run_number, token_budget=None, estimated_tokens=0, count=1):
+    """Extract currency information using OpenAI API with an admission controller for rate limiting.
+
+    With count > 1, runs run_number to run_number + count - 1 are sampled in a single
+    request and a list of results is returned.
+    """
+    from openai import BadRequestError, RateLimitError
+    from extractors import FATAL_ERRORS, RETRYABLE_ERRORS
+    
+    label = f"Run {run_number}" if count == 1 else f"Runs {run_number}-{run_number + count - 1}"
+    
+    async with admission:
+        console.print(f"\n[bold green]Starting {label}[/bold green]")
         
         try:
-            # Create extractor using factory
-            extractor = ExtractorFactory.create_extractor(extraction_method, model_config)
-            
-            # Perform extraction
-            result = await extractor.extract(content, schema, run_number)
-            return result
+            # Perform extraction, retrying transient errors such as 429s
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(6),
+                wait=wait_retry_after,
+                retry=retry_if_exception_type(RETRYABLE_ERRORS),
+                before_sleep=before_sleep_log(logger, logging.WARNING),
+                reraise=True,
+            ):
+                with attempt:
+                    # Every attempt sends the full prompt, so each one is charged against the token budget
+                    try:
+                        async with token_budget.transact(estimated_tokens) if token_budget else nullcontext():
+                            if count > 1:
+                                return await extractor.extract_batch(content, schema, run_number, count)
+                            return await extractor.extract(content, schema, run_number)
+                    except RateLimitError:
+                        # Send fewer requests at once until the rate limit window resets
+                        await admission.throttle()
+                        raise
+        except FATAL_ERRORS:
+            # Let the task group cancel the remaining runs
+            raise
+        except BadRequestError:
+            # A rejected batch is retried per run by the caller; a single run is just dropped
+            if count > 1:
+                raise
+            logger.error(f"Request rejected for {label}", exc_info=True)
+            return None
         except Exception as e:
-            logger.error(f"Error during extraction for Run {run_number}: {str(e)}", exc_info=True)
+            logger.error(f"Error during extraction for {label}: {str(e)}", exc_info=True)
             return None
 
-async def process_runs(file_path, schema_path, num_runs, model_config, extraction_method="json_mode"):
-    """Process multiple runs in parallel with a semaphore."""
-    semaphore = Semaphore(5)  # Limit to 5 concurrent requests
-    tasks = []
-    
-    for run in range(num_runs):
-        console.print(f"\n[bold green]Starting Run {run + 1}/{num_runs}[/bold green]")
-        task = asyncio.create_task(extract_currency_async(file_path, schema_path, semaphore, run + 1, model_config, extraction_method))
-        tasks.append(task)
-    
-    results = await asyncio.gather(*tasks)
-    return [r for r in results if r is not None]
+def prefetch_inputs(file_path, schema_path):
+    """Start reading the document and schema in background threads; returns a future for each."""
+    return (
+        _prefetch_executor.submit(Path(file_path).read_text, encoding='utf-8'),
+        _prefetch_executor.submit(Path(schema_path).read_bytes),
+    )
 
-def display_results(results, output_schema_path):
-    """Display individual results and summary based on the selected output schema."""
-    # Read the output schema
-    with open(output_schema_path, 'r', encoding='utf-8') as f:
-        output_schema = json.load(f)
-    
-    # Create a table for individual results
-    table = Table(title="Individual Results")
-    
-    # Add run number as first column
-    table.add_column("Run", style="bold magenta")
-    
-    # Add columns based on the output schema fields
-    for field in output_schema['fields']:
-        table.add_column(field['description'], style="cyan")
-    
-    # Add rows with data from results
-    for idx, result in enumerate(results, 1):
-        row_data = [str(idx)]  # Start with run number
-        for field in output_schema['fields']:
-            # Try different variations of the field name
-            field_name = field['name']
-            # Try exact match first
-            value = result.get(field_name)
-            if value is None:
-                # Try with spaces replaced by underscores
-                value = result.get(field_name.replace(' ', '_'))
-            if value is None:
-                # Try with lowercase
-                value = result.get(field_name.lower())
-            if value is None:
-                # Try with lowercase and spaces replaced by underscores
-                value = result.get(field_name.lower().replace(' ', '_'))
-            if value is None:
-                value = 'N/A'
-            row_data.append(str(value))
-        table.add_row(*row_data)
-    
-    console.print(table)
-    
-    # Calculate summary statistics for numeric fields
-    summary_text = f"Total Runs: {len(results)}\n"
-    
-    for field in output_schema['fields']:
-        field_name = field['name']
-        # Try different variations of the field name
-        values = []
-        for result in results:
-            value = result.get(field_name)
-            if value is None:
-                value = result.get(field_name.replace(' ', '_'))
-            if value is None:
-                value = result.get(field_name.lower())
-            if value is None:
-                value = result.get(field_name.lower().replace(' ', '_'))
-            values.append(value)
+async def process_runs(file_path, schema_path, num_runs, model_config, extraction_method="json_mode", max_concurrent=5, warm_cache=True, on_result=None, batch_completions=True, prefetched=None):
+    """Process multiple runs in parallel, at most max_concurrent at a time.
+
+    Every run sends the same prompt, so with warm_cache the first run is sent on its own
+    and the remaining runs can reuse the provider's cached prompt prefix. With
+    batch_completions, extractors that support it sample up to MAX_COMPLETIONS_PER_REQUEST
+    runs in one request. If given, on_result is called with each successful result as
+    soon as its run finishes, and prefetched holds the futures from prefetch_inputs.
+    """
+    # Read the document and schema once and in parallel; every run uses the same input
+    if prefetched:
+        reads = [asyncio.wrap_future(future) for future in prefetched]
+    else:
+        reads = [
+            asyncio.to_thread(Path(file_path).read_text, encoding='utf-8'),
+            asyncio.to_thread(Path(schema_path).read_bytes),
+        ]
+    content, schema_bytes = await asyncio.gather(*reads)
+    schema = orjson.loads(schema_bytes)
+    
+    admission = AdmissionController(max_concurrent)  # Limit concurrent requests
+    
+    # Optionally limit tokens per minute to stay under the deployment's TPM quota
+    tokens_per_minute = model_config.get('tokens_per_minute')
+    token_budget = CreditSemaphore(tokens_per_minute) if tokens_per_minute else None
+    estimated_tokens = estimate_tokens(content) + estimate_tokens(orjson.dumps(schema).decode())
+    
+    # Imported here so the OpenAI SDK is only loaded once runs actually start
+    from openai import BadRequestError
+    from extractors import FATAL_ERRORS, ExtractorFactory, create_client
+    
+    results = []
+    
+    def deliver(result):
+        if result is not None:
+            results.append(result)
+            if on_result:
+                on_result(result)
+    
+    # One client for all runs, so they share its connection pool
+    async with create_client() as client:
+        extractor = ExtractorFactory.create_extractor(extraction_method, model_config, client)
         
-        # Only calculate statistics for numeric values
-        numeric_values = [v for v in values if isinstance(v, (int, float))]
-        if numeric_values:
+        async def run(run_number):
+            deliver(await extract_currency_async(extractor, content, schema, admission, run_number, token_budget, estimated_tokens))
+        
+        async def run_batch(first_run, count):
             try:
-                avg = mean(numeric_values)
-                summary_text += f"Average {field['description']}: {avg:.2f}\n"
-            except:
-                pass
+                batch = await extract_currency_async(extractor, content, schema, admission, first_run, token_budget, estimated_tokens, count)
+            except BadRequestError:
+                # The deployment may not support n completions; send one request per run instead
+                await asyncio.gather(*(run(run_number) for run_number in range(first_run, first_run + count)))
+                return
+            # Any other failure, including exhausted retries, drops the batch's runs
+            for result in batch or ():
+                deliver(result)
         
-        # For non-numeric fields, show most common value
         try:
-            most_common = mode(values)
-            summary_text += f"Most Common {field['description']}: {most_common}\n"
-        except:
-            pass
+            first_run = 1
+            if warm_cache and num_runs > 1:
+                await run(1)
+                first_run = 2
+            
+            # If a run fails in a way every run would, the group cancels the others
+            async with asyncio.TaskGroup() as tg:
+                if batch_completions and hasattr(extractor, 'extract_batch'):
+                    for start in range(first_run, num_runs + 1, MAX_COMPLETIONS_PER_REQUEST):
+                        count = min(MAX_COMPLETIONS_PER_REQUEST, num_runs + 1 - start)
+                        tg.create_task(run_batch(start, count) if count > 1 else run(start))
+                else:
+                    for run_number in range(first_run, num_runs + 1):
+                        tg.create_task(run(run_number))
+        except* FATAL_ERRORS as eg:
+            error = eg.exceptions[0]
+            logger.error(f"Stopping all runs after a fatal API error: {str(error)}")
+            console.print(f"\n[red]Stopping all runs: {str(error)}[/red]")
+    
+    return results
+
+# Translation table mapping spaces and hyphens in field names to underscores
+_KEY_TABLE = str.maketrans(' -', '__')
+
+def normalize_key(name):
+    """Normalize a field name or result key for lookups."""
+    return name.lower().translate(_KEY_TABLE)
+
+@lru_cache(maxsize=None)
+def load_output_schema(output_schema_path):
+    """Read and parse an output schema once per path."""
+    return orjson.loads(Path(output_schema_path).read_bytes())
+
+class ResultsTable:
+    """Table of extraction results that grows as runs finish, with summary statistics."""
+
+    def __init__(self, output_schema):
+        from rich import box
+        from rich.table import Table
+        
+        # Create a table for individual results; the simple box style is cheap to redraw while rows stream in
+        self.table = Table(title="Individual Results", box=box.SIMPLE, pad_edge=False)
+        
+        # Add run number as first column
+        self.table.add_column("Run", style="bold magenta")
+        
+        # Add columns based on the output schema fields
+        for field in output_schema['fields']:
+            self.table.add_column(field['description'], style="cyan")
+        
+        # Match result keys to field names case-insensitively with spaces as underscores
+        self.field_keys = [(field, normalize_key(field['name'])) for field in output_schema['fields']]
+        self.values_by_field = {key: [] for _, key in self.field_keys}
+        self.count = 0
+
+    def add_result(self, result):
+        """Add a row for a result, keeping each field's value for the summary."""
+        self.count += 1
+        result = {normalize_key(k): v for k, v in result.items()}
+        row_data = [str(self.count)]  # Start with run number
+        for field, key in self.field_keys:
+            value = result.get(key)
+            self.values_by_field[key].append(value)
+            row_data.append('N/A' if value is None else str(value))
+        self.table.add_row(*row_data)
+
+    def print_summary(self):
+        """Print summary statistics from the values collected for each field."""
+        summary_lines = [f"Total Runs: {self.count}"]
+        
+        for field, key in self.field_keys:
+            values = self.values_by_field[key]
+            numeric_values = [value for value in values if isinstance(value, (int, float))]
+            if numeric_values:
+                avg = sum(numeric_values) / len(numeric_values)
+                summary_lines.append(f"Average {field['description']}: {avg:.2f}")
+            
+            # For non-numeric fields, show most common value
+            most_common = Counter(map(str, values)).most_common(1)
+            if most_common:
+                summary_lines.append(f"Most Common {field['description']}: {most_common[0][0]}")
+        
+        summary_text = "\n".join(summary_lines) + "\n"
+        console.print(Panel.fit(summary_text, title="Summary Statistics", border_style="blue"))
+
+@dataclass(frozen=True, slots=True)
+class ResolvedConfig:
+    """Selections and settings for a batch of runs, resolved once from config.json and the command line."""
+    file_path: str
+    schema_path: str
+    output_schema_path: str
+    model: str
+    model_config: dict
+    extractor: str
+    num_runs: int
+    max_concurrent: int = 5
+    warm_prompt_cache: bool = True
+    batch_completions: bool = True
+
+    @classmethod
+    def from_config(cls, config, file_path, schema_path, output_schema_path, model, extractor, num_runs):
+        return cls(
+            file_path=file_path,
+            schema_path=schema_path,
+            output_schema_path=output_schema_path,
+            model=model,
+            model_config=config['models'][model],
+            extractor=extractor,
+            num_runs=num_runs,
+            max_concurrent=config.get('max_concurrent', 5),
+            warm_prompt_cache=config.get('warm_prompt_cache', True),
+            batch_completions=config.get('batch_completions', True),
+        )
+
+def run_and_display(resolved, prefetched=None):
+    """Run the extractions, adding each result to a live table as soon as it arrives."""
+    from rich.live import Live
+    
+    results_table = ResultsTable(load_output_schema(resolved.output_schema_path))
     
-    console.print(Panel.fit(summary_text, title="Summary Statistics", border_style="blue"))
+    try:
+        with Live(results_table.table, console=console, refresh_per_second=4):
+            try:
+                asyncio.run(process_runs(
+                    resolved.file_path, resolved.schema_path, resolved.num_runs, resolved.model_config, resolved.extractor,
+                    resolved.max_concurrent, resolved.warm_prompt_cache,
+                    on_result=results_table.add_result,
+                    batch_completions=resolved.batch_completions,
+                    prefetched=prefetched
+                ))
+            finally:
+                # Print the remaining logs above the table before Live renders it for the last time
+                flush_logs()
+        # Live only ends its final render with a newline on a terminal
+        if not console.is_terminal:
+            console.line()
+    except KeyboardInterrupt:
+        # Keep the results that finished before the interrupt
+        console.print("\n[yellow]Runs interrupted, showing completed results[/yellow]")
+    
+    if results_table.count:
+        results_table.print_summary()
+    else:
+        console.print("[red]No successful results to display.[/red]")
 
-def validate_defaults(config):
+REQUIRED_DEFAULTS = ['default_doc', 'default_schema', 'default_output_schema', 'default_model', 'default_extractor']
+
+def validate_defaults(config, quiet=False):
     """Validate that all required defaults are set in the config."""
-    required_defaults = ['default_doc', 'default_schema', 'default_output_schema', 'default_model', 'default_extractor']
-    missing_defaults = [default for default in required_defaults if default not in config]
+    missing_defaults = [default for default in REQUIRED_DEFAULTS if not config.get(default)]
     
     if missing_defaults:
-        console.print("[red]Missing required defaults in config.json:[/red]")
-        for default in missing_defaults:
-            console.print(f"  - {default}")
+        if not quiet:
+            console.print("[red]Missing required defaults in config.json:[/red]")
+            for default in missing_defaults:
+                console.print(f"  - {default}")
         return False
     return True
 
-def get_default_paths(config):
+def get_default_paths(config, quiet=False):
     """Get default paths based on config."""
     outputs_dir = "outputs"
     schemas_dir = "schemas"
@@ -410,23 +521,67 @@ def get_default_paths(config):
     output_schema_path = os.path.join(output_schemas_dir, config['default_output_schema'])
     
     # Validate that all files exist
-    if not os.path.exists(file_path):
-        console.print(f"[red]Default document not found: {file_path}[/red]")
+    if not os.path.isfile(file_path):
+        if not quiet:
+            console.print(f"[red]Default document not found: {file_path}[/red]")
         return None, None, None
-    if not os.path.exists(schema_path):
-        console.print(f"[red]Default schema not found: {schema_path}[/red]")
+    if not os.path.isfile(schema_path):
+        if not quiet:
+            console.print(f"[red]Default schema not found: {schema_path}[/red]")
         return None, None, None
-    if not os.path.exists(output_schema_path):
-        console.print(f"[red]Default output schema not found: {output_schema_path}[/red]")
+    if not os.path.isfile(output_schema_path):
+        if not quiet:
+            console.print(f"[red]Default output schema not found: {output_schema_path}[/red]")
         return None, None, None
     
     return file_path, schema_path, output_schema_path
 
+def apply_overrides(config, args):
+    """Override config defaults with command line arguments."""
+    if args.doc:
+        config['default_doc'] = args.doc
+    if args.schema:
+        config['default_schema'] = args.schema
+    if args.output_schema:
+        config['default_output_schema'] = args.output_schema
+    if args.model:
+        config['default_model'] = args.model
+    if args.extractor:
+        config['default_extractor'] = args.extractor
+
+def resolve_defaults(config, num_runs, quiet=False):
+    """Validate the configured defaults and resolve them in one pass, or return None.
+
+    With quiet=True nothing is printed, so the caller can fall back to interactive mode.
+    """
+    if not validate_defaults(config, quiet):
+        if not quiet:
+            console.print("[red]Cannot run with defaults: missing configuration[/red]")
+        return None
+    
+    if config['default_model'] not in config.get('models', {}):
+        if not quiet:
+            console.print(f"[red]Default model not found in config: {config['default_model']}[/red]")
+        return None
+    
+    file_path, schema_path, output_schema_path = get_default_paths(config, quiet)
+    if not all([file_path, schema_path, output_schema_path]):
+        if not quiet:
+            console.print("[red]Cannot run with defaults: missing files[/red]")
+        return None
+    
+    return ResolvedConfig.from_config(
+        config, file_path, schema_path, output_schema_path,
+        config['default_model'], config['default_extractor'], num_runs
+    )
+
 def main():
     try:
         # Parse command line arguments
         parser = argparse.ArgumentParser(description='Extract fields from documents using AI')
-        parser.add_argument('-y', '--yes', action='store_true', help='Run with all defaults without prompting')
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument('-y', '--yes', action='store_true', help='Run with all defaults without prompting')
+        mode.add_argument('--interactive', action='store_true', help='Choose the model, extractor and files from lists, with the defaults preselected')
         parser.add_argument('-n', '--num-runs', type=int, help='Number of runs to perform')
         parser.add_argument('--doc', help='Default document to use')
         parser.add_argument('--schema', help='Default schema to use')
@@ -443,56 +598,48 @@ def main():
             return
         
         # Override config defaults with command line arguments
-        if args.doc:
-            config['default_doc'] = args.doc
-        if args.schema:
-            config['default_schema'] = args.schema
-        if args.output_schema:
-            config['default_output_schema'] = args.output_schema
-        if args.model:
-            config['default_model'] = args.model
-        if args.extractor:
-            config['default_extractor'] = args.extractor
+        apply_overrides(config, args)
         
-        # If -y flag is used, validate all defaults
-        if args.yes:
-            if not validate_defaults(config):
-                console.print("[red]Cannot run with defaults: missing configuration[/red]")
+        # Use the defaults when they are complete and --interactive isn't given; -y requires them
+        resolved = None
+        if not args.interactive:
+            resolved = resolve_defaults(config, args.num_runs if args.num_runs is not None else 1, quiet=not args.yes)  # Use -n value or default to 1
+            if args.yes and not resolved:
                 return
+        
+        if resolved:
+            # Read the inputs while the SDK is imported and the client is set up
+            prefetched = prefetch_inputs(resolved.file_path, resolved.schema_path)
             
-            file_path, schema_path, output_schema_path = get_default_paths(config)
-            if not all([file_path, schema_path, output_schema_path]):
-                console.print("[red]Cannot run with defaults: missing files[/red]")
-                return
+            console.print("[green]Running with all defaults:[/green]")
+            console.print(f"Document: {os.path.basename(resolved.file_path)}")
+            console.print(f"Schema: {os.path.basename(resolved.schema_path)}")
+            console.print(f"Output Schema: {os.path.basename(resolved.output_schema_path)}")
+            console.print(f"Model: {resolved.model}")
+            console.print(f"Extractor: {resolved.extractor}")
             
-            selected_model = config['default_model']
-            selected_extractor = config['default_extractor']
-            num_runs = args.num_runs if args.num_runs is not None else 1  # Use -n value or default to 1
+            # Without -y, still ask for the number of runs and a confirmation if someone can answer
+            confirm = not args.yes and sys.stdin.isatty()
+            if confirm and args.num_runs is None:
+                resolved = replace(resolved, num_runs=get_number_of_runs())
             
-            console.print("[green]Running with all defaults:[/green]")
-            console.print(f"Document: {os.path.basename(file_path)}")
-            console.print(f"Schema: {os.path.basename(schema_path)}")
-            console.print(f"Output Schema: {os.path.basename(output_schema_path)}")
-            console.print(f"Model: {selected_model}")
-            console.print(f"Extractor: {selected_extractor}")
-            console.print(f"Number of runs: {num_runs}")
+            console.print(f"Number of runs: {resolved.num_runs}")
             
-            # Perform runs in parallel
-            with console.status("[bold green]Processing runs in parallel...[/bold green]"):
-                results = asyncio.run(process_runs(file_path, schema_path, num_runs, config['models'][selected_model], selected_extractor))
+            if confirm and not Confirm.ask("\n[bold green]Proceed with this configuration?[/bold green]", default=True):
+                console.print("[yellow]Operation cancelled by user[/yellow]")
+                return
             
-            if results:
-                display_results(results, output_schema_path)
-            else:
-                console.print("[red]No successful results to display.[/red]")
+            # Perform runs in parallel
+            run_and_display(resolved, prefetched)
             return
         
-        # Interactive mode
-        selected_model = select_model(config)
+        # Interactive mode; --interactive shows every list even when a default is set
+        use_default = not args.interactive
+        selected_model = select_model(config, use_default)
         if not selected_model:
             return
         
-        selected_extractor = select_extractor(config)
+        selected_extractor = select_extractor(config, use_default)
         if not selected_extractor:
             return
         
@@ -500,19 +647,22 @@ def main():
             console.print("[yellow]Operation cancelled by user[/yellow]")
             return
         
-        file_path = select_file(config)
+        file_path = select_file(config, use_default)
         if not file_path:
             return
         
         console.print(f"\n[green]Selected file:[/green] {file_path}")
         
-        schema_path = select_schema(config)
+        schema_path = select_schema(config, use_default)
         if not schema_path:
             return
         
         console.print(f"\n[green]Selected schema:[/green] {schema_path}")
         
-        output_schema_path = select_output_schema(config)
+        # Read the inputs while the remaining questions are answered
+        prefetched = prefetch_inputs(file_path, schema_path)
+        
+        output_schema_path = select_output_schema(config, use_default)
         if not output_schema_path:
             return
         
@@ -521,13 +671,10 @@ def main():
         # Use -n value if provided, otherwise prompt
         num_runs = args.num_runs if args.num_runs is not None else get_number_of_runs()
         
-        with console.status("[bold green]Processing runs in parallel...[/bold green]"):
-            results = asyncio.run(process_runs(file_path, schema_path, num_runs, config['models'][selected_model], selected_extractor))
-        
-        if results:
-            display_results(results, output_schema_path)
-        else:
-            console.print("[red]No successful results to display.[/red]")
+        run_and_display(ResolvedConfig.from_config(
+            config, file_path, schema_path, output_schema_path,
+            selected_model, selected_extractor, num_runs
+        ), prefetched)
     except KeyboardInterrupt:
         console.print("\n[yellow]Operation cancelled by user[/yellow]")
         return
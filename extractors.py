@@ -1,12 +1,12 @@
 from abc import ABC, abstractmethod
-import json
+import asyncio
+import orjson
+import openai
 from openai import AsyncAzureOpenAI
 import logging
-from datetime import datetime
-import os
-from dotenv import load_dotenv
+import time
 import instructor
-from models import create_model_from_schema, DateEncoder
+from models import OPENAI_API_VERSION, OPENAI_ENDPOINT, OPENAI_KEY, create_model_from_schema
 from typing import Type, Dict, Any
 from pydantic import BaseModel
 
@@ -21,19 +21,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+# Transient API errors that are retried by the caller instead of dropping the run
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+def create_client() -> AsyncAzureOpenAI:
+    """Create the Azure OpenAI client shared by all extractors and runs."""
+    return AsyncAzureOpenAI(
+        api_key=OPENAI_KEY,
+        api_version=OPENAI_API_VERSION,
+        azure_endpoint=OPENAI_ENDPOINT,
+        # tenacity in extract.py is the only retry layer, so every 429 reaches the admission controller
+        max_retries=0
+    )
+
+# API errors that every other run would hit as well, so the whole batch is stopped
+FATAL_ERRORS = (
+    openai.AuthenticationError,
+    openai.PermissionDeniedError,
+    openai.NotFoundError,
+)
+
+class JsonDump:
+    """Serialize a result for logging only when the record is actually emitted."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return orjson.dumps(self.value, option=orjson.OPT_INDENT_2).decode()
 
 class BaseExtractor(ABC):
-    def __init__(self, model_config):
+    def __init__(self, model_config, client):
         self.model_config = model_config
-        self.openai_key = os.getenv("openai_key")
-        self.openai_endpoint = os.getenv("openai_endpoint")
-        self.openai_api_version = os.getenv("openai_api_version")
-        self.client = AsyncAzureOpenAI(
-            api_key=self.openai_key,
-            api_version=self.openai_api_version,
-            azure_endpoint=self.openai_endpoint
-        )
+        self.openai_client = client
+        self.client = client
 
     @abstractmethod
     async def extract(self, content: str, schema: dict, run_number: int) -> dict:
@@ -41,11 +69,21 @@ class BaseExtractor(ABC):
         pass
 
 class JsonModeExtractor(BaseExtractor):
-    async def extract(self, content: str, schema: dict, run_number: int) -> dict:
+    def __init__(self, model_config, client):
+        super().__init__(model_config, client)
+        # Serialized schema for the system prompt, reused while the same schema is passed in
+        self._schema = None
+        self._schema_json = None
+
+    def _create_params(self, content: str, schema: dict) -> dict:
+        """Build the chat completion parameters for a document and schema."""
+        if schema is not self._schema:
+            self._schema, self._schema_json = schema, orjson.dumps(schema).decode()
+
         messages = [
             {"role": "system", "content": f"""
                 You are a helpful assistant that extracts information from documents. Return the response as a JSON based on this schema:
-                {json.dumps(schema)}
+                {self._schema_json}
              """},
             {"role": "user", "content": f"""
                 Extract the information from this text:
@@ -53,50 +91,83 @@ class JsonModeExtractor(BaseExtractor):
             """}
         ]
         
+        create_params = {
+            "model": self.model_config['deployment'],
+            "messages": messages,
+            "response_format": { "type": "json_object" }
+        }
+        
+        if 'temperature' in self.model_config:
+            create_params['temperature'] = self.model_config['temperature']
+        
+        return create_params
+
+    async def extract(self, content: str, schema: dict, run_number: int) -> dict:
         try:
             logger.info(f"Starting Run {run_number} using JSON mode")
             
-            start_time = datetime.now()
+            start_time = time.perf_counter()
             
-            create_params = {
-                "model": self.model_config['deployment'],
-                "messages": messages,
-                "response_format": { "type": "json_object" }
-            }
+            response = await self.client.chat.completions.create(**self._create_params(content, schema))
             
-            if 'temperature' in self.model_config:
-                create_params['temperature'] = self.model_config['temperature']
+            duration = time.perf_counter() - start_time
+            logger.info(f"Run {run_number} completed in {duration:.2f} seconds")
+            logger.info("Response: %s", response.choices[0].message.content)
+            
+            return orjson.loads(response.choices[0].message.content)
+        except RETRYABLE_ERRORS + FATAL_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Error during API call for Run {run_number}: {str(e)}", exc_info=True)
+            return None
+
+    async def extract_batch(self, content: str, schema: dict, run_number: int, count: int) -> list:
+        """Sample count extractions in a single request using n completions."""
+        last_run = run_number + count - 1
+        try:
+            logger.info(f"Starting Runs {run_number}-{last_run} using JSON mode with {count} completions")
+            
+            start_time = time.perf_counter()
+            
+            create_params = self._create_params(content, schema)
+            create_params['n'] = count
             
             response = await self.client.chat.completions.create(**create_params)
-            end_time = datetime.now()
             
-            duration = (end_time - start_time).total_seconds()
-            logger.info(f"Run {run_number} completed in {duration:.2f} seconds")
-            logger.info(f"Response: {response.choices[0].message.content}")
+            duration = time.perf_counter() - start_time
+            logger.info(f"Runs {run_number}-{last_run} completed in {duration:.2f} seconds")
             
-            return json.loads(response.choices[0].message.content)
+            results = []
+            for choice in response.choices:
+                logger.info("Run %s: finish_reason=%s, system_fingerprint=%s", run_number + choice.index, choice.finish_reason, response.system_fingerprint)
+                logger.info("Response: %s", choice.message.content)
+                try:
+                    results.append(orjson.loads(choice.message.content))
+                except (orjson.JSONDecodeError, TypeError) as e:
+                    # One malformed completion shouldn't discard the rest of the batch
+                    logger.error(f"Invalid JSON in Run {run_number + choice.index}: {str(e)}")
+            return results
+        except RETRYABLE_ERRORS + FATAL_ERRORS:
+            raise
+        except openai.BadRequestError:
+            # Let the caller fall back to one request per run, e.g. when n isn't supported
+            raise
         except Exception as e:
-            logger.error(f"Error during API call for Run {run_number}: {str(e)}", exc_info=True)
+            logger.error(f"Error during API call for Runs {run_number}-{last_run}: {str(e)}", exc_info=True)
             return None
 
 class InstructorExtractor(BaseExtractor):
-    def __init__(self, model_config):
-        super().__init__(model_config)
-        # Create an instructor-patched client
-        self.client = instructor.from_openai(
-            AsyncAzureOpenAI(
-                api_key=self.openai_key,
-                api_version=self.openai_api_version,
-                azure_endpoint=self.openai_endpoint,
-            )
-        )
+    def __init__(self, model_config, client):
+        super().__init__(model_config, client)
+        # Patch the shared client with instructor
+        self.client = instructor.from_openai(self.openai_client)
 
     async def extract(self, content: str, schema: dict, run_number: int) -> dict:
         try:
             logger.info(f"Starting Run {run_number} using Instructor mode")
-            start_time = datetime.now()
+            start_time = time.perf_counter()
 
-            # Create the model from schema
+            # Get the model for this schema; create_model_from_schema caches it across runs
             DocModel = create_model_from_schema(schema)
             
             # Extract structured data
@@ -115,15 +186,16 @@ class InstructorExtractor(BaseExtractor):
                 ],
             )
             
-            end_time = datetime.now()
-            duration = (end_time - start_time).total_seconds()
+            duration = time.perf_counter() - start_time
             logger.info(f"Run {run_number} completed in {duration:.2f} seconds")
             
             # Convert the Pydantic model to a dict
             result = doc_data.model_dump()
-            logger.info(f"Response: {json.dumps(result, indent=2, cls=DateEncoder)}")
+            logger.info("Response: %s", JsonDump(result))
             
             return result
+        except RETRYABLE_ERRORS + FATAL_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Error during API call for Run {run_number}: {str(e)}", exc_info=True)
             return None
@@ -132,9 +204,9 @@ class StructuredOutputExtractor(BaseExtractor):
     async def extract(self, content: str, schema: dict, run_number: int) -> dict:
         try:
             logger.info(f"Starting Run {run_number} using Structured Output mode")
-            start_time = datetime.now()
+            start_time = time.perf_counter()
 
-            # Create the model from schema
+            # Get the model for this schema; create_model_from_schema caches it across runs
             DocModel = create_model_from_schema(schema)
             
             # Extract structured data using parse method
@@ -153,27 +225,28 @@ class StructuredOutputExtractor(BaseExtractor):
                 response_format=DocModel
             )
             
-            end_time = datetime.now()
-            duration = (end_time - start_time).total_seconds()
+            duration = time.perf_counter() - start_time
             logger.info(f"Run {run_number} completed in {duration:.2f} seconds")
             
             # Convert the Pydantic model to a dict
             result = doc_data.choices[0].message.parsed.model_dump()
-            logger.info(f"Response: {json.dumps(result, indent=2, cls=DateEncoder)}")
+            logger.info("Response: %s", JsonDump(result))
             
             return result
+        except RETRYABLE_ERRORS + FATAL_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Error during API call for Run {run_number}: {str(e)}", exc_info=True)
             return None
 
 class ExtractorFactory:
     @staticmethod
-    def create_extractor(method: str, model_config: dict) -> BaseExtractor:
+    def create_extractor(method: str, model_config: dict, client: AsyncAzureOpenAI) -> BaseExtractor:
         if method == "json_mode":
-            return JsonModeExtractor(model_config)
+            return JsonModeExtractor(model_config, client)
         elif method == "instructor":
-            return InstructorExtractor(model_config)
+            return InstructorExtractor(model_config, client)
         elif method == "structured_output":
-            return StructuredOutputExtractor(model_config)
+            return StructuredOutputExtractor(model_config, client)
         else:
             raise ValueError(f"Unknown extraction method: {method}") 
\ No newline at end of file
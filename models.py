@@ -1,120 +1,265 @@
-import json
+import asyncio
+import hashlib
+import orjson
 from datetime import date
+from functools import lru_cache
+from dataclasses import dataclass
 from typing import List, Optional, Dict, Any, Type, Union
-from pydantic import BaseModel, Field, create_model
-import instructor
-from openai import AzureOpenAI
+from pydantic import BaseModel, ConfigDict, Field, create_model
 from dotenv import load_dotenv
 import os
+import sys
+from pathlib import Path
 
-# Load environment variables
-load_dotenv()
+# Load environment variables once, unless the importing script already did
+if not os.getenv("openai_key"):
+    load_dotenv()
 
+OPENAI_KEY = os.getenv("openai_key")
+OPENAI_ENDPOINT = os.getenv("openai_endpoint")
+OPENAI_API_VERSION = os.getenv("openai_api_version")
 
-class DateEncoder(json.JSONEncoder):
-    """Custom JSON encoder to handle date objects."""
-    def default(self, obj):
-        if isinstance(obj, date):
-            return obj.isoformat()
-        return super().default(obj)
+
+# Schemas waiting to be built by _build_model, keyed by their hash
+_pending_schemas: Dict[str, Dict[str, Any]] = {}
+
+
+def _schema_key(schema: Dict[str, Any]) -> str:
+    """Hash a schema so equal schemas share one cached model."""
+    canonical = orjson.dumps(schema, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(canonical, digest_size=16).hexdigest()
+
+
+@lru_cache(maxsize=64)
+def _load_schema(path: str, mtime_ns: int, size: int) -> tuple[Dict[str, Any], str]:
+    """Read a schema file and hash it; cached until the file's mtime or size changes."""
+    with open(path, 'rb') as f:
+        schema = orjson.loads(f.read())
+    return schema, _schema_key(schema)
 
 
 def create_model_from_schema(schema_path_or_dict: Union[str, Dict[str, Any]]) -> Type[BaseModel]:
-    """Creates Pydantic models dynamically from any JSON schema file or dictionary."""
+    """Creates Pydantic models dynamically from any JSON schema file or dictionary.
+
+    Models are cached by schema contents, so equal schemas return the same class.
+    """
     # If schema_path_or_dict is a string, treat it as a file path
     if isinstance(schema_path_or_dict, str):
-        with open(schema_path_or_dict, 'r') as f:
-            schema = json.load(f)
+        stat = os.stat(schema_path_or_dict)
+        schema, key = _load_schema(schema_path_or_dict, stat.st_mtime_ns, stat.st_size)
     else:
         schema = schema_path_or_dict
+        key = _schema_key(schema)
+    
+    _pending_schemas[key] = schema
+    try:
+        return _build_model(key)
+    finally:
+        _pending_schemas.pop(key, None)
 
-    def get_field_type(field_schema: Dict[str, Any]) -> Type:
-        """Recursively determine the Python type from a JSON schema field."""
-        field_type = field_schema.get('type')
-        
-        if field_type == 'string':
-            if field_schema.get('format') == 'date':
-                return date
-            return str
-        elif field_type == 'number':
-            return float
-        elif field_type == 'boolean':
-            return bool
-        elif field_type == 'array':
-            if 'items' in field_schema:
-                item_schema = field_schema['items']
-                if item_schema.get('type') == 'object':
-                    # Create a model for array items
-                    item_field_definitions: Dict[str, tuple] = {}
-                    for item_field_name, item_field_schema in item_schema['properties'].items():
-                        item_python_field_name = item_field_name.lower().replace(' ', '_')
-                        item_field_definitions[item_python_field_name] = (
-                            get_field_type(item_field_schema),
-                            Field(
-                                alias=item_field_name,
-                                description=item_field_schema.get('description', '')
-                            )
-                        )
-                    
-                    ItemModel = create_model(
-                        f'{item_schema.get("title", "Item")}',
-                        **item_field_definitions
-                    )
-                    return List[ItemModel]
-                else:
-                    return List[get_field_type(item_schema)]
-        elif field_type == 'object':
-            # Create a nested model
-            nested_field_definitions: Dict[str, tuple] = {}
-            for nested_field_name, nested_field_schema in field_schema.get('properties', {}).items():
-                nested_python_field_name = nested_field_name.lower().replace(' ', '_')
-                nested_field_definitions[nested_python_field_name] = (
-                    get_field_type(nested_field_schema),
-                    Field(
-                        alias=nested_field_name,
-                        description=nested_field_schema.get('description', '')
-                    )
-                )
-            
-            NestedModel = create_model(
-                f'{field_schema.get("title", "NestedModel")}',
-                **nested_field_definitions
-            )
-            return NestedModel
-        
-        return Any  # Default fallback type
 
-    # Create field definitions for the main model
-    field_definitions: Dict[str, tuple] = {}
+# Field kinds, resolved once per schema when it is normalized
+KIND_ANY, KIND_STR, KIND_DATE, KIND_FLOAT, KIND_BOOL, KIND_LIST, KIND_OBJECT, KIND_INT = range(8)
+
+# Python types for the kinds that don't need a nested model
+_PRIMITIVE_TYPES = {KIND_STR: str, KIND_DATE: date, KIND_FLOAT: float, KIND_BOOL: bool, KIND_INT: int}
+
+
+@dataclass(frozen=True, slots=True)
+class NormalizedType:
+    """The type of a schema field with its kind, title, fields and item type resolved."""
+    kind: int
+    title: str = ''
+    fields: tuple['NormalizedField', ...] = ()
+    items: Optional['NormalizedType'] = None
+
+
+@dataclass(frozen=True, slots=True)
+class NormalizedField:
+    """A schema property with its Python name, alias and description precomputed."""
+    py_name: str
+    alias: str
+    description: str
+    required: bool
+    type: NormalizedType
+
+
+@lru_cache(maxsize=1024)
+def _python_name(field_name: str) -> str:
+    """Convert a schema property name to a Python field name, interned so repeated names share one string."""
+    return sys.intern(field_name.lower().replace(' ', '_'))
+
+
+def _normalize_fields(properties: Dict[str, Any], required_fields=None) -> tuple[NormalizedField, ...]:
+    """Normalize object properties; all fields are required unless required_fields is given."""
+    return tuple(
+        NormalizedField(
+            py_name=_python_name(field_name),
+            alias=field_name,
+            description=field_schema.get('description', ''),
+            required=required_fields is None or field_name in required_fields,
+            type=_normalize_type(field_schema),
+        )
+        for field_name, field_schema in properties.items()
+    )
+
+
+def _normalize_string(field_schema: Dict[str, Any]) -> NormalizedType:
+    return NormalizedType(KIND_DATE if field_schema.get('format') == 'date' else KIND_STR)
+
+
+def _normalize_array(field_schema: Dict[str, Any]) -> NormalizedType:
+    if 'items' not in field_schema:
+        return NormalizedType(KIND_ANY)
+    item_schema = field_schema['items']
+    if item_schema.get('type') == 'object':
+        # Array items get their own model
+        items = NormalizedType(KIND_OBJECT, item_schema.get('title', 'Item'), _normalize_fields(item_schema.get('properties', {})))
+    else:
+        items = _normalize_type(item_schema)
+    return NormalizedType(KIND_LIST, items=items)
+
+
+def _normalize_object(field_schema: Dict[str, Any]) -> NormalizedType:
+    return NormalizedType(KIND_OBJECT, field_schema.get('title', 'NestedModel'), _normalize_fields(field_schema.get('properties', {})))
+
+
+# Primitive JSON schema types resolve in one lookup; the rest have a handler
+_PRIMITIVE_KINDS = {'number': KIND_FLOAT, 'boolean': KIND_BOOL, 'integer': KIND_INT}
+_TYPE_HANDLERS = {'string': _normalize_string, 'array': _normalize_array, 'object': _normalize_object}
+
+
+def _normalize_type(field_schema: Dict[str, Any]) -> NormalizedType:
+    """Recursively resolve the kind of a JSON schema field."""
+    field_type = field_schema.get('type')
     
-    # Get the list of required fields from the schema
-    required_fields = schema.get('required', [])
+    kind = _PRIMITIVE_KINDS.get(field_type)
+    if kind is not None:
+        return NormalizedType(kind)
     
-    # Process each property from the schema
-    for field_name, field_schema in schema.get('properties', {}).items():
-        # Convert field name to Python-friendly name
-        python_field_name = field_name.lower().replace(' ', '_')
-        
-        # Get the field type
-        field_type = get_field_type(field_schema)
-        
-        # Create the field definition
-        field_definitions[python_field_name] = (
-            Optional[field_type] if field_name not in required_fields else field_type,
-            Field(
-                alias=field_name,
-                description=field_schema.get('description', '')
+    handler = _TYPE_HANDLERS.get(field_type)
+    return handler(field_schema) if handler else NormalizedType(KIND_ANY)  # Default fallback type
+
+
+def _normalize_schema(schema: Dict[str, Any]) -> NormalizedType:
+    """Walk a schema once and return its top-level object with every field resolved."""
+    return NormalizedType(
+        KIND_OBJECT,
+        schema.get('title', 'DynamicModel'),
+        _normalize_fields(schema.get('properties', {}), frozenset(schema.get('required', ()))),
+    )
+
+
+def _python_type(node: NormalizedType) -> Type:
+    """Return the Python type for a normalized field type."""
+    kind = node.kind
+    python_type = _PRIMITIVE_TYPES.get(kind)
+    if python_type is not None:
+        return python_type
+    elif kind == KIND_LIST:
+        return List[_python_type(node.items)]
+    elif kind == KIND_OBJECT:
+        return _nested_model(node)
+    return Any
+
+
+@lru_cache(maxsize=512)
+def _nested_model(node: NormalizedType) -> Type[BaseModel]:
+    """Create a nested model once per distinct shape; normalized types compare by structure.
+
+    Nested models defer building their own validator: the top-level model compiles their
+    schema into its own in one pass, so a standalone validator would never be used.
+    """
+    return _create_object_model(node, __config__=ConfigDict(defer_build=True))
+
+
+def _create_object_model(node: NormalizedType, **model_kwargs) -> Type[BaseModel]:
+    """Create a Pydantic model for a normalized object."""
+    field_definitions: Dict[str, tuple] = {}
+    for field in node.fields:
+        field_type = _python_type(field.type)
+        if field.required:
+            field_definitions[field.py_name] = (
+                field_type,
+                Field(alias=field.alias, description=field.description)
             )
-        )
+        else:
+            # Only fields the schema doesn't require may be left out, and default to None
+            field_definitions[field.py_name] = (
+                Optional[field_type],
+                Field(default=None, alias=field.alias, description=field.description)
+            )
+    
+    return create_model(node.title, **field_definitions, **model_kwargs)
+
+
+# Config for top-level models; current Pydantic only accepts a ConfigDict as __config__
+MODEL_CONFIG = ConfigDict(validate_by_name=True)
+
 
+@lru_cache(maxsize=128)
+def _build_model(schema_key: str) -> Type[BaseModel]:
+    """Build the Pydantic model for a pending schema."""
     # Create the model with Pydantic v2 config
-    Model = create_model(
-        schema.get('title', 'DynamicModel'),
-        **field_definitions,
-        __config__=type('Config', (), {'validate_by_name': True})
+    return _create_object_model(
+        _normalize_schema(_pending_schemas[schema_key]),
+        __config__=MODEL_CONFIG
     )
+
+
+@lru_cache(maxsize=1)
+def _get_client():
+    """Create the instructor-patched Azure OpenAI client once and reuse its connection pool."""
+    # Imported here so using create_model_from_schema doesn't load the OpenAI stack
+    import instructor
+    from openai import AzureOpenAI
     
-    return Model
+    return instructor.from_openai(
+        AzureOpenAI(
+            api_key=OPENAI_KEY,
+            api_version=OPENAI_API_VERSION,
+            azure_endpoint=OPENAI_ENDPOINT,
+        )
+    )
+
+
+# Instructions shared by every invoice request; they start each system prompt so that
+# Azure OpenAI can serve the fixed prefix from its prompt cache
+INVOICE_INSTRUCTIONS = (
+    "You are an expert at extracting structured data from invoices. "
+    "Extract the data according to the provided schema. "
+    "Use the field descriptions in the schema to decide which value belongs in each field. "
+)
+
+# What the user message contains, for a single invoice and for a batch
+SINGLE_INVOICE_INPUT = "The user message contains the markdown content of one invoice.\n\n"
+BATCH_INVOICE_INPUT = (
+    "The user message contains several invoices, each preceded by a line like ===INVOICE 1===. "
+    "Return exactly one entry per invoice, in the same order.\n\n"
+)
+
+
+@lru_cache(maxsize=128)
+def get_json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Return a model's JSON schema, generated once per model class.
+
+    The returned dict is shared between callers and must not be modified.
+    """
+    return model.model_json_schema()
+
+
+@lru_cache(maxsize=128)
+def _build_system_prompt(model: Type[BaseModel], input_description: str) -> str:
+    """Build a system prompt once per model and input description; it only changes with the schema."""
+    return INVOICE_INSTRUCTIONS + input_description + "Schema:\n" + orjson.dumps(get_json_schema(model)).decode()
+
+
+def _invoice_messages(model: Type[BaseModel], markdown_content: str) -> list[dict]:
+    """Build the chat messages with the stable prompt first and the invoice last."""
+    return [
+        {"role": "system", "content": _build_system_prompt(model, SINGLE_INVOICE_INPUT)},
+        {"role": "user", "content": markdown_content}
+    ]
 
 
 def extract_invoice_data(markdown_path: str, schema_path: str) -> tuple[Type[BaseModel], BaseModel]:
@@ -132,34 +277,139 @@ def extract_invoice_data(markdown_path: str, schema_path: str) -> tuple[Type[Bas
     with open(markdown_path, 'r') as f:
         markdown_content = f.read()
     
-    # Create an instructor-patched Azure OpenAI client
-    client = instructor.from_openai(
-        AzureOpenAI(
-            api_key=os.getenv("openai_key"),
-            api_version=os.getenv("openai_api_version"),
-            azure_endpoint=os.getenv("openai_endpoint"),
-        )
+    # Extract structured data
+    invoice_data = _get_client().chat.completions.create(
+        model="gpt-4o-global",
+        response_model=InvoiceModel,
+        messages=_invoice_messages(InvoiceModel, markdown_content),
     )
     
-    # Extract structured data
-    invoice_data = client.chat.completions.create(
+    return InvoiceModel, invoice_data
+
+
+def extract_invoice_json(markdown_path: str, schema_path: str) -> bytes:
+    """Extract invoice data and return it as indented JSON bytes, ready to write to a file or API."""
+    InvoiceModel, invoice_data = extract_invoice_data(markdown_path, schema_path)
+    
+    # The model's own serializer writes bytes directly, without an intermediate dict or str
+    return InvoiceModel.__pydantic_serializer__.to_json(invoice_data, indent=2)
+
+
+def extract_invoice_data_streaming(markdown_path: str, schema_path: str, on_partial=None) -> tuple[Type[BaseModel], BaseModel]:
+    """Like extract_invoice_data, but streams the response and validates it as it arrives.
+
+    on_partial, if given, is called with each partially filled invoice, for example to show
+    progress. The final partial is validated against the full model before it is returned.
+    """
+    InvoiceModel = create_model_from_schema(schema_path)
+    
+    # Read the markdown content
+    with open(markdown_path, 'r') as f:
+        markdown_content = f.read()
+    
+    # Instructor wraps the model in Partial and yields a more complete object per chunk
+    last = None
+    for partial in _get_client().chat.completions.create_partial(
+        model="gpt-4o-global",
+        response_model=InvoiceModel,
+        messages=_invoice_messages(InvoiceModel, markdown_content),
+    ):
+        last = partial
+        if on_partial:
+            on_partial(partial)
+    
+    if last is None:
+        raise ValueError("The response stream was empty")
+    
+    return InvoiceModel, InvoiceModel.model_validate(last.model_dump(by_alias=True, exclude_unset=True))
+
+
+# Separator placed before each invoice when several are sent in one request
+INVOICE_DELIMITER = "\n\n===INVOICE {}===\n\n"
+
+
+@lru_cache(maxsize=128)
+def _batch_model(model: Type[BaseModel]) -> Type[BaseModel]:
+    """Wrap a model in a response model holding a list of them."""
+    return create_model('InvoiceBatch', invoices=(List[model], Field(description="One entry per invoice, in order")))
+
+
+def extract_invoice_batch(markdown_paths: list[str], schema_path: str, batch_size: int = 8) -> list[BaseModel]:
+    """Extract several invoices that share a schema, sending up to batch_size invoices per request.
+
+    Returns one extracted instance per markdown path, in the same order. If the model returns
+    the wrong number of invoices for a batch, that batch is extracted one invoice at a time.
+    """
+    InvoiceModel = create_model_from_schema(schema_path)
+    BatchModel = _batch_model(InvoiceModel)
+    
+    results = []
+    for start in range(0, len(markdown_paths), batch_size):
+        batch_paths = markdown_paths[start:start + batch_size]
+        
+        # Read the markdown content and join the invoices with numbered delimiters
+        parts = []
+        for number, markdown_path in enumerate(batch_paths, 1):
+            with open(markdown_path, 'r') as f:
+                parts.append(INVOICE_DELIMITER.format(number) + f.read())
+        
+        batch = _get_client().chat.completions.create(
+            model="gpt-4o-global",
+            response_model=BatchModel,
+            messages=[
+                {"role": "system", "content": _build_system_prompt(InvoiceModel, BATCH_INVOICE_INPUT)},
+                {"role": "user", "content": "".join(parts)}
+            ],
+        )
+        
+        if len(batch.invoices) == len(batch_paths):
+            results.extend(batch.invoices)
+        else:
+            results.extend(extract_invoice_data(markdown_path, schema_path)[1] for markdown_path in batch_paths)
+    
+    return results
+
+
+async def extract_invoice_data_async(markdown_path: str, schema_path: str, client) -> tuple[Type[BaseModel], BaseModel]:
+    """Async version of extract_invoice_data using an instructor-patched AsyncAzureOpenAI client."""
+    InvoiceModel = create_model_from_schema(schema_path)
+    
+    # Read the markdown content without blocking the event loop
+    markdown_content = await asyncio.to_thread(Path(markdown_path).read_text)
+    
+    invoice_data = await client.chat.completions.create(
         model="gpt-4o-global",
         response_model=InvoiceModel,
-        messages=[
-            {
-                "role": "system",
-                "content": "You are an expert at extracting structured data from invoices. Extract the data according to the provided schema."
-            },
-            {
-                "role": "user",
-                "content": f"Extract the invoice data from this markdown content:\n\n{markdown_content}"
-            }
-        ],
+        messages=_invoice_messages(InvoiceModel, markdown_content),
     )
     
     return InvoiceModel, invoice_data
 
 
+async def extract_many(paths: list[tuple[str, str]], concurrency: int = 8) -> list[tuple[Type[BaseModel], BaseModel]]:
+    """Extract several (markdown_path, schema_path) pairs concurrently, at most concurrency at a time.
+
+    Results are returned in the same order as paths.
+    """
+    import instructor
+    from openai import AsyncAzureOpenAI
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async with AsyncAzureOpenAI(
+        api_key=OPENAI_KEY,
+        api_version=OPENAI_API_VERSION,
+        azure_endpoint=OPENAI_ENDPOINT,
+    ) as openai_client:
+        client = instructor.from_openai(openai_client)
+        
+        async def extract_one(markdown_path, schema_path):
+            async with semaphore:
+                return await extract_invoice_data_async(markdown_path, schema_path, client)
+        
+        return await asyncio.gather(*(extract_one(markdown_path, schema_path) for markdown_path, schema_path in paths))
+
+
 # Example usage:
 if __name__ == "__main__":
     # Extract data from the markdown file
@@ -168,9 +418,9 @@ if __name__ == "__main__":
         "schemas/cronos-boekhouding.json"
     )
     # print the model schema
-    print(InvoiceModel.model_json_schema())
+    print(get_json_schema(InvoiceModel))
 
-    # Print the extracted data using the custom encoder
-    print(json.dumps(invoice_data.model_dump(), indent=2, cls=DateEncoder))
+    # Print the extracted data; pydantic-core serializes it, dates included, in one pass
+    print(invoice_data.model_dump_json(indent=2))
 
     
\ No newline at end of file
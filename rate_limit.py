@@ -0,0 +1,89 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens in a text (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+class CreditSemaphore:
+    """Limit the number of tokens sent to a deployment per time window.
+
+    Each request takes credits equal to its estimated token count and the credits are
+    returned refund_time seconds after the request finishes, which keeps the total
+    below a tokens-per-minute limit instead of only limiting concurrent requests.
+    """
+
+    def __init__(self, credits: int):
+        self.capacity = credits
+        self.available = credits
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, credits: int) -> int:
+        # A single request larger than the whole budget must still be able to run
+        credits = min(credits, self.capacity)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.available >= credits)
+            self.available -= credits
+        return credits
+
+    async def release(self, credits: int):
+        async with self._condition:
+            self.available += credits
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def transact(self, credits: int, refund_time: float = 60):
+        """Hold credits for the duration of a request and refund them refund_time seconds later."""
+        credits = await self.acquire(credits)
+        try:
+            yield
+        finally:
+            loop = asyncio.get_running_loop()
+            loop.call_later(refund_time, lambda: loop.create_task(self.release(credits)))
+
+
+class AdmissionController:
+    """Limit the number of concurrent requests with a limit that can change at runtime.
+
+    On a rate limit error, throttle() lowers the limit by one and restores it after a
+    cooldown, so the client backs off without dropping requests.
+    """
+
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self.limit = max_concurrent
+        self.active = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def release(self):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify(1)
+
+    async def resize(self, limit: int):
+        async with self._condition:
+            self.limit = limit
+            self._condition.notify_all()
+
+    async def throttle(self, cooldown: float = 60):
+        """Lower the limit by one and raise it again after cooldown seconds."""
+        await self.resize(max(1, self.limit - 1))
+        loop = asyncio.get_running_loop()
+        loop.call_later(cooldown, lambda: loop.create_task(self._recover()))
+
+    async def _recover(self):
+        await self.resize(min(self.max_concurrent, self.limit + 1))
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()